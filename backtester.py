@@ -2,9 +2,68 @@
 回测模块，负责策略的历史回测和性能评估
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
+from kernels import run_backtest_kernel, run_scenarios_kernel, max_drawdown_kernel, LONG, SHORT, FLAT
+
+# 交易方向名称与内核编码之间的映射
+_TRADE_TYPE_CODES = {None: FLAT, 'long': LONG, 'short': SHORT}
+_TRADE_TYPE_NAMES = {FLAT: None, LONG: 'long', SHORT: 'short'}
+
+PIP_VALUE = 10  # 假设1手=10美元/点，根据实际情况调整
+PROGRESS_STEPS = 10  # 指定进度回调时回测分成的段数
+
+
+def _minmax_downsample(values, n_out=4000):
+    """
+    按等宽分桶保留每桶的最小值和最大值，对序列降采样用于绘图
+    :param values: 一维数值数组
+    :param n_out: 期望保留的最大点数
+    :return: 保留点的位置索引（升序）
+    """
+    n = len(values)
+    if n <= n_out:
+        return np.arange(n)
+
+    n_bins = max(1, (n_out - 4) // 2)  # 每桶两点，另留首尾和末尾残桶共四点
+    bin_size = n // n_bins
+    m = n_bins * bin_size
+    offsets = np.arange(n_bins) * bin_size
+    bins = values[:m].reshape(n_bins, bin_size)
+    idx = [offsets + bins.argmin(axis=1), offsets + bins.argmax(axis=1), [0, n - 1]]
+    if m < n:
+        # 末尾不足一桶的部分单独作为一桶
+        tail = values[m:]
+        idx.append([m + tail.argmin(), m + tail.argmax()])
+    return np.unique(np.concatenate(idx))
+
+
+def _empty_trade_cols():
+    """
+    创建空的按列交易记录
+    :return: 各列为空数组的字典
+    """
+    return {
+        'type': np.empty(0, dtype=np.int8),
+        'entry': np.empty(0, dtype=np.float64),
+        'exit': np.empty(0, dtype=np.float64),
+        'volume': np.empty(0, dtype=np.float64),
+        'pnl': np.empty(0, dtype=np.float64),
+        'commission': np.empty(0, dtype=np.float64),
+        'time': np.empty(0, dtype=np.int64)
+    }
+
+def progress_checkpoints(n):
+    """
+    计算指定进度回调时回测各段的结束位置
+    :param n: K线数量
+    :return: 升序排列的结束位置列表，最后一项为n；K线数少于段数时去除重复位置和0
+    """
+    return sorted({n * step // PROGRESS_STEPS for step in range(1, PROGRESS_STEPS + 1)} - {0})
+
 
 class Backtester:
     """回测器，用于执行策略回测和生成性能报告"""
@@ -18,11 +77,27 @@ class Backtester:
         self.config = config
         self.initial_balance = initial_balance
         self.balance = initial_balance
-        self.equity_curve = []
-        self.trades = []
+        self.equity_curve = np.empty(0, dtype=np.float64)
+        # 交易记录按列存储（结构数组形式），每列一个numpy数组
+        self._trade_cols = _empty_trade_cols()
+        self._n_trades = 0
         self.commission_per_lot = config['risk_management']['commission_per_lot']
         self.allow_consecutive_trades = config['trading'].get('allow_consecutive_trades', False)
         self.last_trade_type = None  # 记录上一笔交易的方向
+        self.pruned = False  # 回测是否被进度回调提前终止
+
+        # 预先解析回测过程中反复用到的配置项，避免逐笔交易遍历嵌套字典
+        rm_config = config['risk_management']
+        sizing_config = rm_config['position_sizing']
+        exit_rules = config['trading']['exit_rules']
+        self._sizing_type = sizing_config['type']
+        self._fixed_volume = sizing_config.get('fixed_volume', 0.0)
+        self._risk_pct = rm_config['risk_percentage']
+        self._sl_mult = rm_config['stop_loss_multiplier']
+        self._sl_type = exit_rules['stop_loss']['type']
+        self._sl_value = exit_rules['stop_loss']['value']
+        self._tp_type = exit_rules['take_profit']['type']
+        self._tp_value = exit_rules['take_profit']['value']
         
     def calculate_position_size(self, price, atr):
         """
@@ -31,15 +106,12 @@ class Backtester:
         :param atr: 当前ATR值
         :return: 交易手数
         """
-        sizing_config = self.config['risk_management']['position_sizing']
-        
-        if sizing_config['type'] == 'fixed':
-            return sizing_config['fixed_volume']
+        if self._sizing_type == 'fixed':
+            return self._fixed_volume
         else:  # risk_based
-            risk_amount = self.balance * self.config['risk_management']['risk_percentage']
-            stop_loss_pips = atr * self.config['risk_management']['stop_loss_multiplier']
-            pip_value = 10  # 假设1手=10美元/点，根据实际情况调整
-            return round(risk_amount / (stop_loss_pips * pip_value), 2)
+            risk_amount = self.balance * self._risk_pct
+            stop_loss_pips = atr * self._sl_mult
+            return round(risk_amount / (stop_loss_pips * PIP_VALUE), 2)
 
     def calculate_exit_prices(self, entry_price, atr, position_type):
         """
@@ -49,23 +121,20 @@ class Backtester:
         :param position_type: 持仓类型 'long' 或 'short'
         :return: (stop_loss, take_profit)
         """
-        sl_config = self.config['trading']['exit_rules']['stop_loss']
-        tp_config = self.config['trading']['exit_rules']['take_profit']
-        
         if position_type == 'long':
-            if sl_config['type'] == 'fixed':
-                stop_loss = entry_price - (atr * sl_config['value'])
+            if self._sl_type == 'fixed':
+                stop_loss = entry_price - (atr * self._sl_value)
             # 可以添加其他止损类型的计算逻辑
             
-            if tp_config['type'] == 'fixed':
-                take_profit = entry_price + (atr * tp_config['value'])
+            if self._tp_type == 'fixed':
+                take_profit = entry_price + (atr * self._tp_value)
             # 可以添加其他止盈类型的计算逻辑
         else:  # short
-            if sl_config['type'] == 'fixed':
-                stop_loss = entry_price + (atr * sl_config['value'])
+            if self._sl_type == 'fixed':
+                stop_loss = entry_price + (atr * self._sl_value)
             
-            if tp_config['type'] == 'fixed':
-                take_profit = entry_price - (atr * tp_config['value'])
+            if self._tp_type == 'fixed':
+                take_profit = entry_price - (atr * self._tp_value)
                 
         return stop_loss, take_profit
 
@@ -77,102 +146,140 @@ class Backtester:
         """
         return volume * self.commission_per_lot
 
-    def run_backtest(self, data):
+    def run_backtest(self, data, progress_callback=None):
         """
         执行回测
         :param data: 包含交易信号和价格数据的DataFrame
+        :param progress_callback: 可选的进度回调，形如callback(已完成比例, 阶段指标字典) -> bool，
+                                  回测分段执行，每段结束后调用，返回False时提前终止回测
         """
-        position = None
-        entry_price = 0
-        volume = 0
-        stop_loss = 0
-        take_profit = 0
-        
-        for index, row in data.iterrows():
-            # 更新权益曲线
-            if position:
-                unrealized_pnl = 0
-                if position == 'long':
-                    unrealized_pnl = (row['close'] - entry_price) * volume * 100000
-                else:  # short
-                    unrealized_pnl = (entry_price - row['close']) * volume * 100000
-                current_equity = self.balance + unrealized_pnl
-                self.equity_curve.append(current_equity)
-                
-                # 检查是否触及止损或止盈
-                if position == 'long':
-                    if row['low'] <= stop_loss or row['high'] >= take_profit:
-                        exit_price = stop_loss if row['low'] <= stop_loss else take_profit
-                        pnl = (exit_price - entry_price) * volume * 100000
-                        commission = self.calculate_commission(volume)
-                        self.balance += pnl - commission
-                        self.last_trade_type = 'long'  # 记录这笔交易的方向
-                        position = None
-                        
-                        self.trades.append({
-                            'type': 'long',
-                            'entry': entry_price,
-                            'exit': exit_price,
-                            'volume': volume,
-                            'pnl': pnl,
-                            'commission': commission,
-                            'time': index  # 记录交易时间
-                        })
-                else:  # short
-                    if row['high'] >= stop_loss or row['low'] <= take_profit:
-                        exit_price = stop_loss if row['high'] >= stop_loss else take_profit
-                        pnl = (entry_price - exit_price) * volume * 100000
-                        commission = self.calculate_commission(volume)
-                        self.balance += pnl - commission
-                        self.last_trade_type = 'short'  # 记录这笔交易的方向
-                        position = None
-                        
-                        self.trades.append({
-                            'type': 'short',
-                            'entry': entry_price,
-                            'exit': exit_price,
-                            'volume': volume,
-                            'pnl': pnl,
-                            'commission': commission,
-                            'time': index  # 记录交易时间
-                        })
-
-            # 处理新的交易信号
-            if not position:  # 只在没有持仓时开新仓
-                can_open_long = row['long_signal'] and (
-                    self.allow_consecutive_trades or  # 如果允许连续交易
-                    self.last_trade_type != 'long'    # 或者上一笔不是做多
-                )
-                can_open_short = row['short_signal'] and (
-                    self.allow_consecutive_trades or  # 如果允许连续交易
-                    self.last_trade_type != 'short'   # 或者上一笔不是做空
+        n = len(data)
+        idx = data.index.to_numpy()
+
+        # 预分配输出数组，交易笔数不会超过K线数量，权益曲线每根K线一个点
+        out_types = np.empty(n, dtype=np.int8)
+        out_entry = np.empty(n, dtype=np.float64)
+        out_exit = np.empty(n, dtype=np.float64)
+        out_volume = np.empty(n, dtype=np.float64)
+        out_pnl = np.empty(n, dtype=np.float64)
+        out_commission = np.empty(n, dtype=np.float64)
+        out_time_idx = np.empty(n, dtype=np.int64)
+        out_equity = np.empty(n, dtype=np.float64)
+
+        long_signals = data['long_signal'].to_numpy(dtype=np.bool_)
+        short_signals = data['short_signal'].to_numpy(dtype=np.bool_)
+        # 有信号的K线位置，空仓时内核只需在这些位置之间跳转
+        signal_idx = np.flatnonzero(long_signals | short_signals)
+
+        close = data['close'].to_numpy(dtype=np.float64)
+        high = data['high'].to_numpy(dtype=np.float64)
+        low = data['low'].to_numpy(dtype=np.float64)
+        atr = data['ATR'].to_numpy(dtype=np.float64)
+
+        # 无进度回调时一次处理全部K线；否则分段执行，持仓状态在段间传递
+        if progress_callback is None:
+            bounds = [n]
+        else:
+            bounds = progress_checkpoints(n)
+
+        self.pruned = False
+        n_trades = 0
+        balance = float(self.balance)
+        last_trade_type = _TRADE_TYPE_CODES[self.last_trade_type]
+        position, entry_price, volume, stop_loss, take_profit = FLAT, 0.0, 0.0, 0.0, 0.0
+        start = 0
+        for stop in bounds:
+            if stop > start:
+                (n_trades, balance, last_trade_type,
+                 position, entry_price, volume, stop_loss, take_profit) = run_backtest_kernel(
+                    close, high, low, atr,
+                    long_signals,
+                    short_signals,
+                    signal_idx,
+                    start, stop, n_trades, balance, last_trade_type,
+                    position, entry_price, volume, stop_loss, take_profit,
+                    float(self._sl_value),
+                    float(self._tp_value),
+                    float(self.commission_per_lot),
+                    float(PIP_VALUE),
+                    float(self._fixed_volume),
+                    float(self._risk_pct),
+                    float(self._sl_mult),
+                    self._sizing_type != 'fixed',
+                    bool(self.allow_consecutive_trades),
+                    out_types, out_entry, out_exit, out_volume, out_pnl,
+                    out_commission, out_time_idx, out_equity
                 )
-                
-                if can_open_long:
-                    volume = self.calculate_position_size(row['close'], row['ATR'])
-                    entry_price = row['close']
-                    stop_loss, take_profit = self.calculate_exit_prices(entry_price, row['ATR'], 'long')
-                    position = 'long'
-                    
-                elif can_open_short:
-                    volume = self.calculate_position_size(row['close'], row['ATR'])
-                    entry_price = row['close']
-                    stop_loss, take_profit = self.calculate_exit_prices(entry_price, row['ATR'], 'short')
-                    position = 'short'
+            start = stop
+
+            if progress_callback is not None and stop < n:
+                interim = {
+                    'Balance': balance,
+                    'Number of Trades': n_trades,
+                    'Max Drawdown (%)': max_drawdown_kernel(out_equity[:stop]) * 100
+                }
+                if not progress_callback(stop / n, interim):
+                    # 提前终止时权益曲线只保留已回测的部分
+                    self.pruned = True
+                    out_equity = out_equity[:stop]
+                    break
+
+        self.balance = balance
+        self.last_trade_type = _TRADE_TYPE_NAMES[last_trade_type]
+        self.equity_curve = out_equity
+        self._trade_cols = {
+            'type': out_types[:n_trades],
+            'entry': out_entry[:n_trades],
+            'exit': out_exit[:n_trades],
+            'volume': out_volume[:n_trades],
+            'pnl': out_pnl[:n_trades],
+            'commission': out_commission[:n_trades],
+            'time': idx[out_time_idx[:n_trades]]  # 记录交易时间
+        }
+        self._n_trades = n_trades
+
+    @property
+    def trades(self):
+        """
+        交易记录列表，每笔交易一个字典。每次访问由列数组重新生成，只读，对列表的修改不会写回回测器
+        :return: 交易记录列表
+        """
+        return self.get_trades_df().to_dict('records')
+
+    def get_trades_df(self):
+        """
+        获取交易记录表
+        :return: 每行一笔交易的DataFrame
+        """
+        cols = dict(self._trade_cols)
+        cols['type'] = np.where(cols['type'] == LONG, 'long', 'short')
+        # 列数组统一为float64；固定手数和每手手续费为整数时，按整数类型输出手数和手续费列，与逐笔记录时一致
+        if self._sizing_type == 'fixed' and isinstance(self._fixed_volume, int):
+            cols['volume'] = cols['volume'].astype(np.int64)
+            if isinstance(self.commission_per_lot, int):
+                cols['commission'] = cols['commission'].astype(np.int64)
+        return pd.DataFrame(cols)
 
     def generate_report(self):
         """
         生成回测报告
         :return: 包含回测结果的字典
         """
-        if not self.trades:
+        n_trades = self._n_trades
+        if n_trades == 0:
             return None
 
-        df = pd.DataFrame(self.trades)
-        total_profit = df['pnl'].sum()
-        total_commission = df['commission'].sum()
+        # 直接在列数组上统计，盈亏掩码只计算一次，后续统计复用
+        pnl = self._trade_cols['pnl']
+        wins = pnl > 0
+        losses = pnl < 0
+        gross_profit = pnl[wins].sum()
+        gross_loss = pnl[losses].sum()
+
+        total_profit = pnl.sum()
+        total_commission = self._trade_cols['commission'].sum()
         net_profit = total_profit - total_commission
-        win_rate = len(df[df['pnl'] > 0]) / len(df) * 100
+        win_rate = wins.sum() / n_trades * 100
         max_drawdown = self.calculate_max_drawdown()
 
         report = {
@@ -182,28 +289,183 @@ class Backtester:
             'Total Commission': total_commission,
             'Win Rate (%)': win_rate,
             'Max Drawdown (%)': max_drawdown * 100,
-            'Number of Trades': len(self.trades),
-            'Average Profit per Trade': net_profit / len(self.trades) if len(self.trades) > 0 else 0,
-            'Profit Factor': abs(df[df['pnl'] > 0]['pnl'].sum() / df[df['pnl'] < 0]['pnl'].sum()) if len(df[df['pnl'] < 0]) > 0 else float('inf')
+            'Number of Trades': n_trades,
+            'Average Profit per Trade': net_profit / n_trades,
+            'Profit Factor': abs(gross_profit / gross_loss) if losses.any() else float('inf')
         }
         return report
 
+    def summarize(self, metrics):
+        """
+        只计算指定评估指标需要的报告项，供参数优化等只关心少数统计量的场景使用
+        :param metrics: 评估指标列表，可包含'profit_factor'、'sharpe_ratio'、'max_drawdown'、'net_profit'
+        :return: 与generate_report同名键的结果字典，没有交易时返回None
+        """
+        if self._n_trades == 0:
+            return None
+
+        pnl = self._trade_cols['pnl']
+        summary = {
+            'Initial Balance': self.initial_balance,
+            'Final Balance': self.balance  # 夏普比率的简化计算只需要期末余额
+        }
+        if 'profit_factor' in metrics:
+            losses = pnl < 0
+            gross_profit = pnl[pnl > 0].sum()
+            gross_loss = pnl[losses].sum()
+            summary['Profit Factor'] = abs(gross_profit / gross_loss) if losses.any() else float('inf')
+        if 'max_drawdown' in metrics:
+            summary['Max Drawdown (%)'] = self.calculate_max_drawdown() * 100
+        if 'net_profit' in metrics:
+            summary['Net Profit'] = pnl.sum() - self._trade_cols['commission'].sum()
+        return summary
+
     def calculate_max_drawdown(self):
         """
         计算最大回撤
         :return: 最大回撤百分比
         """
-        equity = pd.Series(self.equity_curve)
-        rolling_max = equity.expanding().max()  # 使用expanding()来计算截至当前的最大值
-        drawdown = (equity - rolling_max) / rolling_max
-        return drawdown.min()
+        return max_drawdown_kernel(np.asarray(self.equity_curve, dtype=np.float64))
+
+    def plot_equity_curve(self, save_path=None):
+        """
+        绘制权益曲线图
+        :param save_path: 图片保存路径，指定时在后台渲染并保存而不弹出窗口
+        """
+        # 长序列先降采样再交给matplotlib，保留每段的高低点，图形外观不变
+        equity = np.asarray(self.equity_curve, dtype=np.float64)
+        idx = _minmax_downsample(equity)
+
+        if save_path is not None:
+            # 无界面渲染：直接使用Figure和Agg画布，不经过pyplot的全局图形管理
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            fig = Figure(figsize=(12, 6))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111)
+            ax.plot(idx, equity[idx])
+            ax.set_title('Equity Curve')
+            ax.set_xlabel('Time')
+            ax.set_ylabel('Balance')
+            ax.grid(True)
+            fig.savefig(save_path)
+            return
+
+        # 延迟导入matplotlib，无界面回测和并行工作进程无需承担其导入开销
+        import matplotlib.pyplot as plt
 
-    def plot_equity_curve(self):
-        """绘制权益曲线图"""
         plt.figure(figsize=(12, 6))
-        plt.plot(self.equity_curve)
+        plt.plot(idx, equity[idx])
         plt.title('Equity Curve')
         plt.xlabel('Time')
         plt.ylabel('Balance')
         plt.grid(True)
         plt.show()
+
+
+def _run_one(config, data, initial_balance):
+    """
+    在工作进程中执行单个回测
+    :param config: 配置字典
+    :param data: 包含交易信号和价格数据的DataFrame
+    :param initial_balance: 初始资金
+    :return: 回测报告字典
+    """
+    backtester = Backtester(config, initial_balance)
+    backtester.run_backtest(data)
+    return backtester.generate_report()
+
+
+def run_parallel(configs, data_map, initial_balance=10000, max_workers=None):
+    """
+    使用多进程并行执行多个品种或多套配置的回测
+    :param configs: 配置字典，键与data_map一致
+    :param data_map: 包含交易信号和价格数据的DataFrame字典，键为品种或策略名称
+    :param initial_balance: 初始资金
+    :param max_workers: 最大进程数，默认为CPU核心数
+    :return: 以相同键索引的回测报告字典
+    """
+    keys = list(data_map.keys())
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # 每个任务相互独立，按块分发以摊薄进程间通信开销
+    chunksize = max(1, len(keys) // (4 * max_workers))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        reports = executor.map(
+            _run_one,
+            [configs[key] for key in keys],
+            [data_map[key] for key in keys],
+            [initial_balance] * len(keys),
+            chunksize=chunksize
+        )
+        return dict(zip(keys, reports))
+
+
+def run_all(data_map, param_grid, config, initial_balance=10000):
+    """
+    在单个进程内使用Numba并行内核，对多个品种批量回测多组止损止盈参数
+    :param data_map: 包含交易信号和价格数据的DataFrame字典，键为品种或策略名称
+    :param param_grid: 参数组合列表，每项为可包含'stop_loss'和'take_profit'（ATR倍数）的字典，
+                       缺省项取配置中的值
+    :param config: 基础配置字典，其余回测参数取自该配置
+    :param initial_balance: 初始资金
+    :return: 以相同键索引的结果DataFrame字典，每行对应一组参数
+    """
+    # 复用Backtester的配置解析
+    backtester = Backtester(config, initial_balance)
+    sl_values = np.array([params.get('stop_loss', backtester._sl_value) for params in param_grid],
+                         dtype=np.float64)
+    tp_values = np.array([params.get('take_profit', backtester._tp_value) for params in param_grid],
+                         dtype=np.float64)
+    n_scenarios = len(param_grid)
+
+    results = {}
+    for key, data in data_map.items():
+        long_signals = data['long_signal'].to_numpy(dtype=np.bool_)
+        short_signals = data['short_signal'].to_numpy(dtype=np.bool_)
+
+        out_balance = np.empty(n_scenarios, dtype=np.float64)
+        out_n_trades = np.empty(n_scenarios, dtype=np.int64)
+        out_gross_profit = np.empty(n_scenarios, dtype=np.float64)
+        out_gross_loss = np.empty(n_scenarios, dtype=np.float64)
+        out_max_drawdown = np.empty(n_scenarios, dtype=np.float64)
+
+        run_scenarios_kernel(
+            data['close'].to_numpy(dtype=np.float64),
+            data['high'].to_numpy(dtype=np.float64),
+            data['low'].to_numpy(dtype=np.float64),
+            data['ATR'].to_numpy(dtype=np.float64),
+            long_signals,
+            short_signals,
+            np.flatnonzero(long_signals | short_signals),
+            float(initial_balance),
+            FLAT,
+            sl_values,
+            tp_values,
+            float(backtester.commission_per_lot),
+            float(PIP_VALUE),
+            float(backtester._fixed_volume),
+            float(backtester._risk_pct),
+            float(backtester._sl_mult),
+            backtester._sizing_type != 'fixed',
+            bool(backtester.allow_consecutive_trades),
+            out_balance, out_n_trades, out_gross_profit, out_gross_loss, out_max_drawdown
+        )
+
+        # 没有亏损交易时盈利因子为无穷大，与generate_report一致
+        profit_factor = np.full(n_scenarios, np.inf)
+        has_loss = out_gross_loss < 0
+        profit_factor[has_loss] = np.abs(out_gross_profit[has_loss] / out_gross_loss[has_loss])
+
+        results[key] = pd.DataFrame({
+            'Stop Loss': sl_values,
+            'Take Profit': tp_values,
+            'Final Balance': out_balance,
+            'Net Profit': out_balance - initial_balance,
+            'Number of Trades': out_n_trades,
+            'Max Drawdown (%)': out_max_drawdown * 100,
+            'Profit Factor': profit_factor
+        })
+    return results
@@ -3,11 +3,23 @@
 """
 
 import MetaTrader5 as mt5
-from datetime import datetime
 import pandas as pd
 
 class DataFetcher:
     """数据获取器，封装MT5数据获取功能"""
+
+    # 时间框架字符串到MT5常量的映射，类加载时构建一次
+    _TIMEFRAME_MAP = {
+        "M1": mt5.TIMEFRAME_M1,
+        "M5": mt5.TIMEFRAME_M5,
+        "M15": mt5.TIMEFRAME_M15,
+        "M30": mt5.TIMEFRAME_M30,
+        "H1": mt5.TIMEFRAME_H1,
+        "H4": mt5.TIMEFRAME_H4,
+        "D1": mt5.TIMEFRAME_D1,
+        "W1": mt5.TIMEFRAME_W1,
+        "MN1": mt5.TIMEFRAME_MN1
+    }
     
     def __init__(self, symbol="EURUSD", timeframe="H1"):
         """
@@ -17,6 +29,7 @@ class DataFetcher:
         """
         self.symbol = symbol
         self.timeframe = self._convert_timeframe(timeframe)
+        self._rates_cache = {}  # 按数据范围缓存的MT5原始K线数组
         
         # 初始化MT5连接
         if not mt5.initialize():
@@ -29,67 +42,83 @@ class DataFetcher:
             print(f"Symbol {self.symbol} is not available")
             raise ValueError(f"Invalid symbol: {self.symbol}")
 
+    def __getstate__(self):
+        """
+        序列化时不携带K线缓存，参数优化向工作进程下发任务时无需重复传输原始K线
+        :return: 对象状态字典
+        """
+        state = self.__dict__.copy()
+        state['_rates_cache'] = {}
+        return state
+
     def _convert_timeframe(self, timeframe_str):
         """
         将时间框架字符串转换为MT5常量
         :param timeframe_str: 时间框架字符串（如"H1"）
         :return: MT5时间框架常量
         """
-        timeframe_map = {
-            "M1": mt5.TIMEFRAME_M1,
-            "M5": mt5.TIMEFRAME_M5,
-            "M15": mt5.TIMEFRAME_M15,
-            "M30": mt5.TIMEFRAME_M30,
-            "H1": mt5.TIMEFRAME_H1,
-            "H4": mt5.TIMEFRAME_H4,
-            "D1": mt5.TIMEFRAME_D1,
-            "W1": mt5.TIMEFRAME_W1,
-            "MN1": mt5.TIMEFRAME_MN1
-        }
-        
-        if timeframe_str not in timeframe_map:
+        timeframe = self._TIMEFRAME_MAP.get(timeframe_str)
+        if timeframe is None:
             print(f"Warning: Invalid timeframe {timeframe_str}, using H1 instead")
             return mt5.TIMEFRAME_H1
         
-        return timeframe_map[timeframe_str]
+        return timeframe
 
-    def get_historical_data(self, config):
-        """获取历史数据"""
+    def get_historical_data(self, config, use_cache=False):
+        """
+        获取历史数据
+        :param config: 配置字典
+        :param use_cache: 是否复用相同数据范围已获取的K线，参数优化时避免重复从MT5拉取
+        :return: 包含历史K线的DataFrame，失败时返回None
+        """
         try:
-            # 确保MT5已初始化
-            if not mt5.initialize():
-                print("Failed to initialize MT5")
-                mt5.shutdown()
-                return None
+            data_settings = config['data_settings']
+            num_bars = data_settings.get('num_bars', 100000)
+            cache_key = (data_settings['history_type'], data_settings.get('start_date'), num_bars)
+            rates = self._rates_cache.get(cache_key) if use_cache else None
 
-            # 使用已转换的时间框架
-            timeframe = self.timeframe  # 使用初始化时已转换的时间框架
-            
-            if config['data_settings']['history_type'] == 'by_date':
-                # 按日期范围获取数据
-                from_date = pd.to_datetime(config['data_settings']['start_date'])
-                rates = mt5.copy_rates_from(
-                    self.symbol,
-                    timeframe,
-                    from_date,
-                    config['data_settings'].get('num_bars', 100000)
-                )
-            else:
-                # 按K线数量获取数据
-                rates = mt5.copy_rates_from_pos(
-                    self.symbol,
-                    timeframe,
-                    0,
-                    config['data_settings'].get('num_bars', 100000)
-                )
+            if rates is None:
+                # 确保MT5已初始化
+                if not mt5.initialize():
+                    print("Failed to initialize MT5")
+                    mt5.shutdown()
+                    return None
+
+                # 使用已转换的时间框架
+                timeframe = self.timeframe  # 使用初始化时已转换的时间框架
+                
+                if data_settings['history_type'] == 'by_date':
+                    # 按日期范围获取数据
+                    from_date = pd.to_datetime(data_settings['start_date'])
+                    rates = mt5.copy_rates_from(
+                        self.symbol,
+                        timeframe,
+                        from_date,
+                        num_bars
+                    )
+                else:
+                    # 按K线数量获取数据
+                    rates = mt5.copy_rates_from_pos(
+                        self.symbol,
+                        timeframe,
+                        0,
+                        num_bars
+                    )
+
+                if rates is None or len(rates) == 0:
+                    print(f"Failed to get historical data from MT5 for {self.symbol}")
+                    return None
 
-            if rates is None or len(rates) == 0:
-                print(f"Failed to get historical data from MT5 for {self.symbol}")
-                return None
+                if use_cache:
+                    self._rates_cache[cache_key] = rates
 
-            # 转换为DataFrame
-            df = pd.DataFrame(rates)
-            df['time'] = pd.to_datetime(df['time'], unit='s')
+            # 转换为DataFrame：直接按结构化数组的字段构建各列，时间列从原始整数秒转换
+            # 使用缓存时复制各列，调用方对DataFrame的修改不会影响缓存的原始数据
+            df = pd.DataFrame(
+                {name: rates[name] for name in rates.dtype.names if name != 'time'},
+                copy=use_cache
+            )
+            df.insert(0, 'time', pd.to_datetime(rates['time'], unit='s'))
             
             print(f"Retrieved {len(df)} bars of historical data")
             print(f"Data range: from {df['time'].iloc[0]} to {df['time'].iloc[-1]}")
@@ -108,7 +137,7 @@ class DataFetcher:
         # 获取最新tick数据
         tick = mt5.symbol_info_tick(self.symbol)
         return {
-            'time': datetime.now(),  # 当前时间
+            'time': pd.Timestamp(tick.time, unit='s'),  # 报价时间，与历史数据的时间列一致
             'bid': tick.bid,  # 买价
             'ask': tick.ask,  # 卖价
             'volume': tick.volume  # 成交量
@@ -2,8 +2,10 @@
 技术指标计算模块，包含多种波动性指标的计算方法
 """
 
+import numpy as np
 import pandas as pd
 import talib
+from kernels import rsi_and_signal_kernel
 
 class Indicators:
     """技术指标计算器，封装多种波动性指标的计算方法"""
@@ -14,6 +16,19 @@ class Indicators:
         :param data: 包含市场数据的DataFrame
         """
         self.data = data
+        self._arrays = {}  # 已提取的价格列数组缓存
+
+    def _array(self, column):
+        """
+        获取价格列的连续float64数组，每列只提取一次
+        :param column: 列名
+        :return: numpy数组
+        """
+        arr = self._arrays.get(column)
+        if arr is None:
+            arr = np.ascontiguousarray(self.data[column].to_numpy(), dtype=np.float64)
+            self._arrays[column] = arr
+        return arr
 
     def calculate_atr(self, window=14):
         """
@@ -21,9 +36,9 @@ class Indicators:
         :param window: 计算窗口，默认为14
         """
         self.data['ATR'] = talib.ATR(
-            self.data['high'].values,
-            self.data['low'].values,
-            self.data['close'].values,
+            self._array('high'),
+            self._array('low'),
+            self._array('close'),
             timeperiod=window
         )
 
@@ -34,7 +49,7 @@ class Indicators:
         :param window_dev: 标准差倍数，默认为2
         """
         upper, middle, lower = talib.BBANDS(
-            self.data['close'].values,
+            self._array('close'),
             timeperiod=window,
             nbdevup=window_dev,
             nbdevdn=window_dev
@@ -48,8 +63,8 @@ class Indicators:
         计算唐奇安通道
         :param window: 计算窗口，默认为20
         """
-        self.data['DC_upper'] = self.data['high'].rolling(window=window).max()
-        self.data['DC_lower'] = self.data['low'].rolling(window=window).min()
+        self.data['DC_upper'] = talib.MAX(self._array('high'), timeperiod=window)
+        self.data['DC_lower'] = talib.MIN(self._array('low'), timeperiod=window)
 
     def calculate_keltner_channels(self, ema_window=20, atr_multiplier=1.5):
         """
@@ -57,19 +72,26 @@ class Indicators:
         :param ema_window: EMA计算窗口，默认为20
         :param atr_multiplier: ATR倍数，默认为1.5
         """
-        self.data['KC_middle'] = talib.EMA(self.data['close'].values, timeperiod=ema_window)
-        self.data['KC_upper'] = self.data['KC_middle'] + (atr_multiplier * self.data['ATR'])
-        self.data['KC_lower'] = self.data['KC_middle'] - (atr_multiplier * self.data['ATR'])
+        middle = talib.EMA(self._array('close'), timeperiod=ema_window)
+        # 复用已计算的ATR列，通道宽度只计算一次，下轨直接写入该缓冲区
+        band = self.data['ATR'].to_numpy(dtype=np.float64) * atr_multiplier
+        self.data['KC_middle'] = middle
+        self.data['KC_upper'] = middle + band
+        self.data['KC_lower'] = np.subtract(middle, band, out=band)
 
     def calculate_chaikin_volatility(self, window=10):
         """
         计算乔金波动率
         :param window: 计算窗口，默认为10
         """
-        self.data['Volatility_Chaikin'] = (
-            self.data['high'].rolling(window=window).std() / 
-            self.data['low'].rolling(window=window).std()
-        )
+        # 两条标准差之比与自由度无关，用TA-Lib的总体标准差代替样本标准差。TA-Lib按滑动平方和计算方差，
+        # 低波动窗口存在抵消误差，与pandas rolling().std()的相对差可达1e-5量级
+        high_std = talib.STDDEV(self._array('high'), timeperiod=window, nbdev=1)
+        low_std = talib.STDDEV(self._array('low'), timeperiod=window, nbdev=1)
+        # 最低价窗口无波动（或波动低于计算精度）时TA-Lib返回0，比值无定义，记为NaN
+        volatility = np.full_like(high_std, np.nan)
+        np.divide(high_std, low_std, out=volatility, where=low_std > 0)
+        self.data['Volatility_Chaikin'] = volatility
 
     def calculate_rvi(self, window=14, signal_window=4):
         """
@@ -77,8 +99,10 @@ class Indicators:
         :param window: RVI计算窗口，默认为14
         :param signal_window: 信号线计算窗口，默认为4
         """
-        self.data['RVI'] = talib.RSI(self.data['close'].values, timeperiod=window)
-        self.data['RVI_signal'] = talib.MA(self.data['RVI'].values, timeperiod=signal_window)
+        # RSI与信号线在同一个JIT内核中一次遍历算出，结果与talib.RSI和talib.MA一致
+        rvi, rvi_signal = rsi_and_signal_kernel(self._array('close'), window, signal_window)
+        self.data['RVI'] = rvi
+        self.data['RVI_signal'] = rvi_signal
 
     def calculate_all_indicators(self):
         """计算所有技术指标"""
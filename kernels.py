@@ -0,0 +1,339 @@
+"""
+数值计算内核模块，包含使用Numba JIT编译的回测热点循环和统计计算
+"""
+
+import os
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+    # TBB线程层不支持fork：运行过并行内核后再创建fork方式的进程池（run_parallel、参数优化），
+    # 进程退出时会挂起。未通过环境变量指定时，按OpenMP、workqueue的顺序选择线程层
+    if 'NUMBA_THREADING_LAYER' not in os.environ and 'NUMBA_THREADING_LAYER_PRIORITY' not in os.environ:
+        numba.config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+except ImportError:  # 未安装numba时退化为普通Python函数，结果一致但速度较慢
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+    prange = range
+
+# 持仓方向编码：1为多头，-1为空头，0为空仓（last_trade_type为0表示尚无交易）
+LONG = 1
+SHORT = -1
+FLAT = 0
+
+
+@njit(cache=True)
+def round2(x):
+    """
+    保留两位小数，与Python内置round(x, 2)结果一致
+    Numba的round先乘100再取整，乘法的舍入误差会使2.675等边界值进位方向与Python不同，
+    这里用Dekker拆分求出x*100的精确误差项，按精确值判断舍入方向，恰好居中时向偶数舍入
+    :param x: 待舍入的数值
+    :return: 舍入后的数值
+    """
+    if not np.isfinite(x) or abs(x) >= 4503599627370496.0:  # 2**52以上均为整数
+        return x
+    # x*100超过2**53时整数部分单独保留，只对小数部分舍入
+    whole = 0.0
+    frac = x
+    if abs(x) >= 9.0e13:
+        whole = np.floor(x)
+        frac = x - whole
+    p = frac * 100.0
+    # frac拆分为高低两部分后与100相乘均无舍入，p + e为frac*100的精确值
+    c = 134217729.0 * frac  # 2**27 + 1
+    hi = c - (c - frac)
+    lo = frac - hi
+    e = (hi * 100.0 - p) + lo * 100.0
+    k = np.floor(p)
+    d = p - k
+    if d > 0.5 or (d == 0.5 and (e > 0.0 or (e == 0.0 and k % 2.0 == 1.0))):
+        k += 1.0
+    if k == 0.0:
+        return whole if whole != 0.0 else 0.0 * x  # 保留负零的符号
+    return whole + k / 100.0
+
+
+@njit(cache=True)
+def run_backtest_kernel(close, high, low, atr, long_sig, short_sig, signal_idx,
+                        start, stop, n_trades, balance, last_trade_type,
+                        position, entry_price, volume, stop_loss, take_profit,
+                        sl_value, tp_value, commission_per_lot, pip_value,
+                        fixed_volume, risk_pct, sl_mult, use_risk_sizing, allow_consec,
+                        out_types, out_entry, out_exit, out_volume, out_pnl,
+                        out_commission, out_time_idx, out_equity):
+    """
+    逐K线执行回测主循环，处理[start, stop)区间的K线，可分段连续调用
+    :param close: 收盘价数组
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param atr: ATR数组
+    :param long_sig: 多头信号数组
+    :param short_sig: 空头信号数组
+    :param signal_idx: 有多头或空头信号的K线位置（升序）
+    :param start: 本段起始K线位置
+    :param stop: 本段结束K线位置（不含）
+    :param n_trades: 已写入的交易笔数
+    :param balance: 账户余额
+    :param last_trade_type: 上一笔交易方向编码
+    :param position: 当前持仓方向编码
+    :param entry_price: 当前持仓入场价
+    :param volume: 当前持仓手数
+    :param stop_loss: 当前持仓止损价
+    :param take_profit: 当前持仓止盈价
+    :param sl_value: 止损ATR倍数
+    :param tp_value: 止盈ATR倍数
+    :param commission_per_lot: 每手手续费
+    :param pip_value: 每点价值
+    :param fixed_volume: 固定手数
+    :param risk_pct: 单笔风险比例
+    :param sl_mult: 仓位计算使用的止损倍数
+    :param use_risk_sizing: 是否按风险计算仓位
+    :param allow_consec: 是否允许同方向连续交易
+    :param out_*: 预分配的交易记录输出数组
+    :param out_equity: 预分配的逐K线权益曲线输出数组
+    :return: (交易笔数, 余额, 最后交易方向编码, 持仓方向编码, 入场价, 手数, 止损价, 止盈价)，
+             用于下一段继续调用
+    """
+    n_signals = signal_idx.shape[0]
+    k = np.searchsorted(signal_idx, start)
+    i = start
+    while i < stop:
+        if position == FLAT:
+            # 空仓时直接跳到下一根有信号的K线，期间权益恒等于账户余额
+            while k < n_signals and signal_idx[k] < i:
+                k += 1
+            nxt = signal_idx[k] if k < n_signals and signal_idx[k] < stop else stop
+            out_equity[i:nxt] = balance
+            if nxt == stop:
+                break
+            i = nxt
+            out_equity[i] = balance
+        else:
+            # 持仓时向后扫描第一根触及止损或止盈的K线，多头的不利价格为最低价、
+            # 有利价格为最高价，空头相反；position为带符号的方向乘数
+            j = i
+            hit_sl = False
+            while j < stop:
+                adverse = low[j] if position == LONG else high[j]
+                favorable = high[j] if position == LONG else low[j]
+                hit_sl = position * (adverse - stop_loss) <= 0.0
+                if hit_sl or position * (favorable - take_profit) >= 0.0:
+                    break
+                j += 1
+
+            # 一次性写入持仓区间（含出场K线）的浮动权益
+            end = j if j < stop else stop - 1
+            for t in range(i, end + 1):
+                out_equity[t] = balance + position * (close[t] - entry_price) * volume * 100000
+            if j == stop:
+                break
+            i = j
+
+            exit_price = stop_loss if hit_sl else take_profit
+            pnl = position * (exit_price - entry_price) * volume * 100000
+            commission = volume * commission_per_lot
+            balance += pnl - commission
+            last_trade_type = position
+
+            out_types[n_trades] = position
+            out_entry[n_trades] = entry_price
+            out_exit[n_trades] = exit_price
+            out_volume[n_trades] = volume
+            out_pnl[n_trades] = pnl
+            out_commission[n_trades] = commission
+            out_time_idx[n_trades] = i
+            n_trades += 1
+            position = FLAT
+
+        # 处理新的交易信号，只在没有持仓时开新仓
+        if position == FLAT:
+            if long_sig[i] and (allow_consec or last_trade_type != LONG):
+                position = LONG
+            elif short_sig[i] and (allow_consec or last_trade_type != SHORT):
+                position = SHORT
+
+            if position != FLAT:
+                if use_risk_sizing:
+                    volume = round2(balance * risk_pct / (atr[i] * sl_mult * pip_value))
+                else:
+                    volume = fixed_volume
+                entry_price = close[i]
+                stop_loss = entry_price - position * atr[i] * sl_value
+                take_profit = entry_price + position * atr[i] * tp_value
+
+        i += 1
+
+    return (n_trades, balance, last_trade_type,
+            position, entry_price, volume, stop_loss, take_profit)
+
+
+@njit(cache=True)
+def max_drawdown_kernel(equity):
+    """
+    单次遍历计算最大回撤，运行中维护历史最高权益和最差回撤
+    :param equity: 权益数组
+    :return: 最大回撤比例（非正数）
+    """
+    worst = 0.0
+    if equity.shape[0] == 0:
+        return worst
+    peak = equity[0]
+    for i in range(1, equity.shape[0]):
+        if equity[i] > peak:
+            peak = equity[i]
+        dd = (equity[i] - peak) / peak
+        if dd < worst:
+            worst = dd
+    return worst
+
+
+@njit(cache=True, parallel=True)
+def run_scenarios_kernel(close, high, low, atr, long_sig, short_sig, signal_idx,
+                         balance, last_trade_type, sl_values, tp_values,
+                         commission_per_lot, pip_value, fixed_volume, risk_pct, sl_mult,
+                         use_risk_sizing, allow_consec,
+                         out_balance, out_n_trades, out_gross_profit, out_gross_loss,
+                         out_max_drawdown):
+    """
+    在同一组行情和信号上并行回测多组止损止盈参数，每组参数在独立线程中运行完整回测
+    :param close: 收盘价数组
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param atr: ATR数组
+    :param long_sig: 多头信号数组
+    :param short_sig: 空头信号数组
+    :param signal_idx: 有多头或空头信号的K线位置（升序）
+    :param balance: 初始账户余额
+    :param last_trade_type: 上一笔交易方向编码
+    :param sl_values: 各组参数的止损ATR倍数数组
+    :param tp_values: 各组参数的止盈ATR倍数数组
+    :param commission_per_lot: 每手手续费
+    :param pip_value: 每点价值
+    :param fixed_volume: 固定手数
+    :param risk_pct: 单笔风险比例
+    :param sl_mult: 仓位计算使用的止损倍数
+    :param use_risk_sizing: 是否按风险计算仓位
+    :param allow_consec: 是否允许同方向连续交易
+    :param out_*: 预分配的各组参数汇总结果输出数组
+    """
+    n = close.shape[0]
+    for s in prange(sl_values.shape[0]):
+        # 每组参数使用各自的交易记录和权益曲线缓冲区
+        types = np.empty(n, dtype=np.int8)
+        entry = np.empty(n, dtype=np.float64)
+        exit_ = np.empty(n, dtype=np.float64)
+        volume = np.empty(n, dtype=np.float64)
+        pnl = np.empty(n, dtype=np.float64)
+        commission = np.empty(n, dtype=np.float64)
+        time_idx = np.empty(n, dtype=np.int64)
+        equity = np.empty(n, dtype=np.float64)
+
+        result = run_backtest_kernel(
+            close, high, low, atr, long_sig, short_sig, signal_idx,
+            0, n, 0, balance, last_trade_type,
+            FLAT, 0.0, 0.0, 0.0, 0.0,
+            sl_values[s], tp_values[s], commission_per_lot, pip_value,
+            fixed_volume, risk_pct, sl_mult, use_risk_sizing, allow_consec,
+            types, entry, exit_, volume, pnl, commission, time_idx, equity
+        )
+        n_trades = result[0]
+
+        gross_profit = 0.0
+        gross_loss = 0.0
+        for t in range(n_trades):
+            if pnl[t] > 0:
+                gross_profit += pnl[t]
+            elif pnl[t] < 0:
+                gross_loss += pnl[t]
+
+        out_balance[s] = result[1]
+        out_n_trades[s] = n_trades
+        out_gross_profit[s] = gross_profit
+        out_gross_loss[s] = gross_loss
+        out_max_drawdown[s] = max_drawdown_kernel(equity)
+
+
+@njit(cache=True)
+def rsi_and_signal_kernel(close, window, signal_window):
+    """
+    单次遍历同时计算Wilder RSI及其简单移动平均信号线，结果与talib.RSI和talib.MA一致
+    :param close: 收盘价数组
+    :param window: RSI计算窗口
+    :param signal_window: 信号线计算窗口
+    :return: (rsi数组, 信号线数组)，预热期为NaN
+    """
+    n = close.shape[0]
+    rsi = np.full(n, np.nan)
+    signal = np.full(n, np.nan)
+    if n <= window:
+        return rsi, signal
+
+    # 初始窗口内的平均涨幅和平均跌幅
+    prev_gain = 0.0
+    prev_loss = 0.0
+    for i in range(1, window + 1):
+        diff = close[i] - close[i - 1]
+        if diff < 0:
+            prev_loss -= diff
+        else:
+            prev_gain += diff
+    prev_gain /= window
+    prev_loss /= window
+
+    # 信号线使用滑动求和，RSI每产生一个新值就累加进窗口
+    first = window + signal_window - 1
+    period_total = 0.0
+    for i in range(window, n):
+        if i > window:
+            diff = close[i] - close[i - 1]
+            prev_loss *= window - 1
+            prev_gain *= window - 1
+            if diff < 0:
+                prev_loss -= diff
+            else:
+                prev_gain += diff
+            prev_loss /= window
+            prev_gain /= window
+        total = prev_gain + prev_loss
+        rsi[i] = 100.0 * (prev_gain / total) if abs(total) >= 1e-14 else 0.0
+
+        period_total += rsi[i]
+        if i >= first:
+            signal[i] = period_total / signal_window
+            period_total -= rsi[i - signal_window + 1]
+    return rsi, signal
+
+
+@njit(cache=True)
+def rolling_mean_kernel(values, window):
+    """
+    滑动求和计算简单移动平均，每步只加入新值、移出旧值，结果与pandas的rolling(window).mean()一致
+    :param values: 数值数组
+    :param window: 计算窗口
+    :return: 移动平均数组，窗口内不足window个有效值时为NaN
+    """
+    n = values.shape[0]
+    out = np.full(n, np.nan)
+    total = 0.0
+    count = 0
+    for i in range(n):
+        value = values[i]
+        if not np.isnan(value):
+            total += value
+            count += 1
+        if i >= window:
+            old = values[i - window]
+            if not np.isnan(old):
+                total -= old
+                count -= 1
+        if count == window:
+            out[i] = total / window
+    return out
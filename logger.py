@@ -1,6 +1,8 @@
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from kernels import max_drawdown_kernel
 
 class TradeLogger:
     def __init__(self, log_file='trading_log.log'):
@@ -20,9 +22,11 @@ class TradeLogger:
             return None
 
         df = pd.DataFrame(self.trades)
-        total_profit = df[df['profit'] > 0]['profit'].sum()
-        total_loss = abs(df[df['profit'] < 0]['profit'].sum())
-        win_rate = len(df[df['profit'] > 0]) / len(df) * 100
+        profit = df['profit'].to_numpy()
+        wins = profit > 0
+        total_profit = profit[wins].sum()
+        total_loss = abs(profit[profit < 0].sum())
+        win_rate = wins.sum() / len(profit) * 100
         risk_reward_ratio = total_profit / total_loss if total_loss != 0 else 0
         max_drawdown = self.calculate_max_drawdown(df['equity'])
 
@@ -36,6 +40,4 @@ class TradeLogger:
         return report
 
     def calculate_max_drawdown(self, equity_series):
-        cumulative_max = equity_series.cummax()
-        drawdown = (equity_series - cumulative_max) / cumulative_max
-        return drawdown.min()
+        return max_drawdown_kernel(equity_series.to_numpy(dtype=np.float64))
@@ -34,7 +34,8 @@ def optimize_strategy(data_fetcher, config):
         metrics=['profit_factor', 'sharpe_ratio', 'max_drawdown', 'net_profit'],
         method='grid',
         n_jobs=-1,
-        config=config
+        config=config,
+        save_format='xlsx'
     )
     
     # 显示优化结果
@@ -1,17 +1,118 @@
+import copy
 import itertools
 import multiprocessing as mp
-import random
-from typing import Dict, List, Callable, Union, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from typing import Dict, List, Callable, Union, Tuple, Optional
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
-from backtester import Backtester
+from backtester import Backtester, progress_checkpoints
 from strategy import TradingStrategy
 from indicators import Indicators
 from signal_generator import SignalGenerator
 from datetime import datetime
 
+# 工作进程内共享的历史数据，由进程池初始化函数设置，每个进程只接收一次
+_worker_data = None
+
+
+def _init_worker(data):
+    """
+    进程池工作进程初始化函数
+    :param data: 所有参数组合共用的历史数据
+    """
+    global _worker_data
+    _worker_data = data
+    # fork启动的进程会继承主进程的剪枝统计，清空后只与本次优化的试验比较
+    _interim_drawdowns.clear()
+
+
+def _evaluate_batch(eval_func: Callable, batch: List[Dict], score_keys: List[str]) -> np.ndarray:
+    """
+    在工作进程中依次评估一批参数组合
+    :param eval_func: 单个参数组合的评估函数
+    :param batch: 参数组合列表
+    :param score_keys: 指标分数键列表
+    :return: 分数矩阵，每行对应一个参数组合，列顺序与score_keys一致；参数由主进程保留，不再回传
+    """
+    scores = np.full((len(batch), len(score_keys)), float('-inf'))
+    for row, params in enumerate(batch):
+        _, result = eval_func(params)
+        for col, key in enumerate(score_keys):
+            scores[row, col] = result.get(key, float('-inf'))
+    return scores
+
+
+def _params_key(params: Dict) -> tuple:
+    """
+    生成参数组合的可哈希键，与参数顺序无关
+    :param params: 参数字典
+    :return: 按参数名排序的(参数名, 取值)元组
+    """
+    return tuple(sorted(params.items()))
+
+
+# 剪枝统计：各进度检查点上已报告的阶段最大回撤（负百分比），每个进程各自维护
+_interim_drawdowns: Dict[float, List[float]] = {}
+_PRUNE_MIN_TRIALS = 8  # 检查点上至少积累这么多试验后才开始剪枝
+_PRUNE_PERCENTILE = 25  # 阶段回撤差于该分位数（最差四分之一）的试验被提前终止
+
+
+def _prune_callback(progress: float, interim: Dict, n_bars: int) -> bool:
+    """
+    回测进度回调，阶段回撤落入已报告试验最差四分之一时终止回测
+    :param progress: 已完成比例
+    :param interim: 阶段指标字典
+    :param n_bars: 回测K线数量，用于确定被终止试验剩余的检查点
+    :return: 是否继续回测
+    """
+    history = _interim_drawdowns.setdefault(progress, [])
+    drawdown = interim['Max Drawdown (%)']
+    keep = (len(history) < _PRUNE_MIN_TRIALS
+            or drawdown >= np.percentile(history, _PRUNE_PERCENTILE, method='lower'))
+    history.append(drawdown)
+    if not keep:
+        # 被终止的试验在其余检查点上记为最差值，使每个检查点的分位数都基于全部试验，而不只是此前
+        # 未被终止的试验，否则各检查点的剪枝会逐级叠加。最大回撤只会随回测推进加深，沿用当前值会
+        # 高估被终止试验；被终止的试验占满最差四分之一后，后续检查点不再剪枝
+        for stop in progress_checkpoints(n_bars):
+            if progress < stop / n_bars and stop < n_bars:
+                _interim_drawdowns.setdefault(stop / n_bars, []).append(float('-inf'))
+    return keep
+
+
+# 已计算指标和信号的数据缓存，键为数据对象id，每个进程各自维护。指标和信号只取决于数据本身
+# （Indicators和SignalGenerator均使用默认参数，不读取配置），只保留最近用过的少量数据，
+# 避免每个进程长期持有多份完整数据副本
+_signal_cache = {}
+_SIGNAL_CACHE_SIZE = 2
+
+
+def _prepare_signals(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    计算指标和交易信号，同一份数据只计算一次
+    :param data: 原始历史数据，不会被修改
+    :return: 包含指标和信号列的DataFrame，调用方只读使用
+    """
+    key = id(data)
+    cached = _signal_cache.get(key)
+    # 同时核对数据对象本身，防止原对象被回收后id被复用
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    
+    # 指标和信号会写入DataFrame，在副本上计算，原始数据保持不变
+    prepared = data.copy()
+    Indicators(prepared).calculate_all_indicators()
+    SignalGenerator(prepared).generate_all_signals()
+    
+    if len(_signal_cache) >= _SIGNAL_CACHE_SIZE:
+        _signal_cache.clear()
+    _signal_cache[key] = (data, prepared)
+    return prepared
+
+
 class StrategyOptimizer:
     """策略参数优化器"""
     
@@ -24,6 +125,17 @@ class StrategyOptimizer:
         self.data_fetcher = data_fetcher
         self.initial_capital = initial_capital
         self.optimization_results = []
+        self._data_cache: Dict[tuple, pd.DataFrame] = {}  # 按数据范围缓存的历史数据
+        self._key_paths: Dict[str, tuple] = {}  # 参数名到配置路径的映射
+        
+    def __getstate__(self):
+        """
+        序列化时不携带历史数据缓存，避免每个任务分块都向工作进程重复传输整份数据
+        :return: 对象状态字典
+        """
+        state = self.__dict__.copy()
+        state['_data_cache'] = {}
+        return state
         
     def define_parameters(self, param_ranges: Dict[str, Union[List, range]]) -> List[Dict]:
         """
@@ -124,15 +236,17 @@ class StrategyOptimizer:
     #     :param results: 回测结果
     #     :return: 夏普比率
     #     """
-    #     returns = pd.Series(results['Daily Returns'])
+    #     returns = np.asarray(results['Daily Returns'], dtype=np.float64)
     #     risk_free_rate = 0.02  # 年化无风险利率
     #     daily_rf = (1 + risk_free_rate) ** (1/252) - 1
         
+    #     # 直接在ndarray上计算，避免构造Series；ddof=1与pandas的std保持一致
     #     excess_returns = returns - daily_rf
-    #     if excess_returns.std() == 0:
+    #     std = excess_returns.std(ddof=1)
+    #     if std == 0:
     #         return 0
             
-    #     sharpe = np.sqrt(252) * excess_returns.mean() / excess_returns.std()
+    #     sharpe = np.sqrt(252) * excess_returns.mean() / std
     #     return sharpe
         
     def optimize(self, param_ranges: Dict[str, Union[List, range]],
@@ -140,15 +254,21 @@ class StrategyOptimizer:
                 method: str = 'grid',
                 n_iterations: int = None,
                 n_jobs: int = -1,
-                config: Dict = None) -> pd.DataFrame:
+                config: Dict = None,
+                prune: bool = False,
+                save_format: Optional[str] = 'parquet',
+                save_path: Optional[str] = None) -> pd.DataFrame:
         """
         执行参数优化
         :param param_ranges: 参数范围字典
         :param metrics: 评估指标列表
-        :param method: 优化方法 ('grid' 或 'random')
-        :param n_iterations: 随机搜索的迭代次数
+        :param method: 优化方法 ('grid'、'random' 或 'bayesian')
+        :param n_iterations: 随机搜索或贝叶斯优化的迭代次数
         :param n_jobs: 并行进程数，-1表示使用所有可用核心
         :param config: 基础配置
+        :param prune: 是否在回测中途终止阶段回撤明显偏差的参数组合，被终止的组合记为无效结果
+        :param save_format: 结果保存格式 ('parquet'、'xlsx' 或 None表示不保存)
+        :param save_path: 结果保存路径，默认按时间戳生成文件名
         :return: 优化结果DataFrame
         """
         if method == 'grid':
@@ -157,33 +277,91 @@ class StrategyOptimizer:
             if n_iterations is None:
                 raise ValueError("n_iterations must be specified for random search")
             param_combinations = self._generate_random_combinations(param_ranges, n_iterations)
+        elif method == 'bayesian':
+            if n_iterations is None:
+                raise ValueError("n_iterations must be specified for bayesian search")
         else:
             raise ValueError(f"Unsupported optimization method: {method}")
             
+        # 剪枝阈值只基于本次优化的试验，不沿用之前在其他数据或参数空间上的统计
+        _interim_drawdowns.clear()
+        
+        # 预先把参数名拆分成配置路径，评估时无需逐次split
+        self._key_paths = {key: tuple(key.split('.')) for key in param_ranges}
+        
         # 设置并行进程数
         if n_jobs == -1:
             n_jobs = mp.cpu_count()
         
-        # 创建进程池
-        with mp.Pool(n_jobs) as pool:
+        # 参数不涉及数据范围时，所有参数组合共用同一份历史数据，只获取一次并在
+        # 每个工作进程初始化时传入，避免逐个参数组合重复获取和传输
+        shared_data = None
+        if config is not None and not any(key.startswith('data_settings.') for key in param_ranges):
+            shared_data = self._get_cached_data(config)
+
+        score_keys = [f'{metric}_score' for metric in metrics]
+        
+        if method == 'bayesian':
+            results = self._optimize_bayesian(param_ranges, metrics, n_iterations, n_jobs, config, prune)
+            result_params = [params for params, _ in results]
+            score_matrix = np.array(
+                [[scores.get(key, float('-inf')) for key in score_keys] for _, scores in results],
+                dtype=np.float64
+            ).reshape(len(results), len(score_keys))
+        else:
             # 使用partial固定其他参数
-            from functools import partial
             eval_func = partial(self._evaluate_parameters_multi_metric, 
                               metrics=metrics,
-                              config=config)
+                              config=config,
+                              prune=prune)
+            
+            # 随机搜索可能抽到重复组合，相同组合只回测一次；记录每个组合对应的结果行
+            row_of = {}
+            unique_combinations = []
+            for params in param_combinations:
+                key = _params_key(params)
+                if key not in row_of:
+                    row_of[key] = len(unique_combinations)
+                    unique_combinations.append(params)
+            n_unique = len(unique_combinations)
             
-            # 执行并行优化
-            results = list(tqdm(
-                pool.imap(eval_func, param_combinations),
-                total=len(param_combinations),
-                desc="Optimizing parameters"
-            ))
+            # 按进程数把任务分块下发，摊薄每个任务的进程间通信开销
+            chunksize = max(1, n_unique // (n_jobs * 4))
             
-        # 整理结果
-        results_df = pd.DataFrame([
-            {**params, **scores}
-            for params, scores in results
-        ])
+            # 执行并行优化。参数组合留在主进程，工作进程只回传分数矩阵，按分块起始行写回；
+            # 单个分块出错时该分块保持-inf，不影响其他分块
+            unique_scores = np.full((n_unique, len(score_keys)), float('-inf'))
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(shared_data,)) as executor:
+                futures = {
+                    executor.submit(_evaluate_batch, eval_func,
+                                    unique_combinations[i:i + chunksize], score_keys): i
+                    for i in range(0, n_unique, chunksize)
+                }
+                with tqdm(total=n_unique, desc="Optimizing parameters") as pbar:
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        n_batch = min(chunksize, n_unique - i)
+                        try:
+                            unique_scores[i:i + n_batch] = future.result()
+                        except Exception as e:
+                            print(f"Error evaluating parameters: {str(e)}")
+                        pbar.update(n_batch)
+            
+            # 按原始组合列表展开结果，重复组合共用同一行分数
+            rows = np.fromiter((row_of[_params_key(params)] for params in param_combinations),
+                               dtype=np.int64, count=len(param_combinations))
+            result_params = param_combinations
+            score_matrix = unique_scores[rows]
+            
+        # 按列整理结果：每个参数一列，指标直接取分数矩阵的列，不逐行构造字典
+        columns = {
+            key: [params[key] for params in result_params]
+            for key in param_ranges
+        }
+        for col, key in enumerate(score_keys):
+            columns[key] = score_matrix[:, col]
+        results_df = pd.DataFrame(columns)
         
         # 重命名列
         column_mapping = {
@@ -196,14 +374,105 @@ class StrategyOptimizer:
         results_df = results_df[results_df['profit_factor_score'] > 0]
         self.optimization_results = results_df.sort_values('profit_factor_score', ascending=False).reset_index(drop=True)
         
-        # 保存到Excel
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        excel_path = f'optimization_results_{timestamp}.xlsx'
-        self.optimization_results.to_excel(excel_path, index=True)  # 添加索引列
-        print(f"\nResults saved to {excel_path}")
+        self._save_results(save_format, save_path)
         
         return self.optimization_results
         
+    def _save_results(self, save_format: Optional[str], save_path: Optional[str]):
+        """
+        保存优化结果，两种格式都不写入行索引（排序后重置的0..n-1序号）
+        :param save_format: 保存格式 ('parquet'、'xlsx' 或 None表示不保存)
+        :param save_path: 保存路径，默认按时间戳生成文件名
+        """
+        if save_format is None:
+            return
+        if save_format not in ('parquet', 'xlsx'):
+            raise ValueError(f"Unsupported save format: {save_format}")
+        
+        if save_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            save_path = f'optimization_results_{timestamp}.{save_format}'
+        
+        if save_format == 'parquet':
+            try:
+                self.optimization_results.to_parquet(save_path, compression='zstd', index=False)
+            except ImportError:
+                # 未安装parquet引擎（pyarrow或fastparquet）时改存为xlsx，避免丢失结果
+                save_path = os.path.splitext(save_path)[0] + '.xlsx'
+                print("\nNo parquet engine installed (pyarrow or fastparquet), saving as xlsx instead")
+                save_format = 'xlsx'
+        if save_format == 'xlsx':
+            self.optimization_results.to_excel(save_path, index=False)
+        print(f"\nResults saved to {save_path}")
+        
+    def _get_cached_data(self, config: Dict) -> pd.DataFrame:
+        """
+        获取历史数据，相同数据范围只获取一次
+        :param config: 配置字典
+        :return: 历史数据DataFrame，获取失败时返回None
+        """
+        data_settings = config['data_settings']
+        key = (
+            data_settings['history_type'],
+            data_settings.get('start_date'),
+            data_settings.get('num_bars', 100000)
+        )
+        data = self._data_cache.get(key)
+        if data is None:
+            data = self.data_fetcher.get_historical_data(config, use_cache=True)
+            if data is not None:
+                self._data_cache[key] = data
+        return data
+
+    def _optimize_bayesian(self, param_ranges: Dict[str, Union[List, range]],
+                           metrics: List[str],
+                           n_iterations: int,
+                           n_jobs: int,
+                           config: Dict,
+                           prune: bool = False) -> List[Tuple[Dict, Dict]]:
+        """
+        使用Optuna的TPE采样器进行贝叶斯优化，根据已评估结果选择下一组参数
+        :param param_ranges: 参数范围字典
+        :param metrics: 评估指标列表，以第一个指标作为优化目标
+        :param n_iterations: 试验次数
+        :param n_jobs: 并行试验数
+        :param config: 基础配置
+        :param prune: 是否在回测中途终止阶段回撤明显偏差的参数组合
+        :return: (参数字典, 指标分数字典) 列表
+        """
+        import optuna
+
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        target = f'{metrics[0]}_score'
+        results = []
+        evaluated = {}  # TPE可能重复建议已评估过的组合，直接复用其分数
+
+        def objective(trial):
+            params = {}
+            for key, value_range in param_ranges.items():
+                if isinstance(value_range, range):
+                    params[key] = trial.suggest_int(
+                        key, value_range.start, value_range[-1], step=value_range.step
+                    )
+                elif isinstance(value_range, (list, tuple)):
+                    params[key] = trial.suggest_categorical(key, list(value_range))
+                else:
+                    raise ValueError(f"Unsupported parameter range type for {key}")
+
+            key = _params_key(params)
+            scores = evaluated.get(key)
+            if scores is None:
+                params, scores = self._evaluate_parameters_multi_metric(
+                    params, metrics=metrics, config=config, prune=prune
+                )
+                evaluated[key] = scores
+            results.append((params, scores))
+            return scores[target]
+
+        study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler())
+        study.optimize(objective, n_trials=n_iterations, n_jobs=n_jobs, show_progress_bar=True)
+        return results
+        
     def _generate_random_combinations(self, param_ranges: Dict[str, Union[List, range]], 
                                     n_iterations: int) -> List[Dict]:
         """
@@ -212,21 +481,24 @@ class StrategyOptimizer:
         :param n_iterations: 迭代次数
         :return: 随机参数组合列表
         """
-        combinations = []
-        for _ in range(n_iterations):
-            params = {}
-            for key, value_range in param_ranges.items():
-                if isinstance(value_range, (list, tuple)):
-                    params[key] = random.choice(value_range)
-                elif isinstance(value_range, range):
-                    params[key] = random.choice(list(value_range))
-                else:
-                    raise ValueError(f"Unsupported parameter range type for {key}")
-            combinations.append(params)
-        return combinations
+        rng = np.random.default_rng()
+        
+        # 每个参数只展开一次取值列表，并一次性抽取全部迭代的索引
+        sampled = {}
+        for key, value_range in param_ranges.items():
+            if not isinstance(value_range, (list, tuple, range)):
+                raise ValueError(f"Unsupported parameter range type for {key}")
+            values = list(value_range)
+            # 按索引从原列表取值，保留原始Python类型
+            sampled[key] = [values[i] for i in rng.integers(0, len(values), size=n_iterations)]
+        
+        return [dict(zip(sampled.keys(), combo)) for combo in zip(*sampled.values())]
         
     def plot_optimization_results(self, top_n: int = 10):
         """可视化优化结果"""
+        # 延迟导入matplotlib，避免每个优化工作进程加载绘图库
+        import matplotlib.pyplot as plt
+
         if len(self.optimization_results) == 0:
             raise ValueError("No optimization results available. Run optimize() first.")
             
@@ -235,8 +507,12 @@ class StrategyOptimizer:
         score_cols = [col for col in results.columns if col.endswith('_score')]
         n_params = len(param_cols)
         
+        # 参数列和指标列只转换一次为数组，供所有图表复用
+        param_values = {param: results[param].to_numpy() for param in param_cols}
+        score_values = results[score_cols].to_numpy()
+        
         # 1. 为每个评估指标绘制散点图
-        for score_col in score_cols:
+        for j, score_col in enumerate(score_cols):
             fig, axes = plt.subplots(n_params, 1, figsize=(10, 6*n_params))
             fig.suptitle(f'Parameter Impact on {score_col}')
             
@@ -244,7 +520,7 @@ class StrategyOptimizer:
                 axes = [axes]
             
             for ax, param in zip(axes, param_cols):
-                ax.scatter(results[param], results[score_col])
+                ax.scatter(param_values[param], score_values[:, j], rasterized=True)
                 ax.set_xlabel(param)
                 ax.set_ylabel(score_col)
                 ax.grid(True)
@@ -254,14 +530,12 @@ class StrategyOptimizer:
         
         # 2. 如果是两个参数，为每个指标绘制热力图
         if n_params == 2:
+            # 一次分组聚合所有指标的均值，各热力图只做展开
+            grouped = results.groupby(param_cols)[score_cols].mean()
             for score_col in score_cols:
                 fig, ax = plt.subplots(figsize=(10, 8))
                 
-                pivot_table = results.pivot_table(
-                    values=score_col, 
-                    index=param_cols[0],
-                    columns=param_cols[1]
-                )
+                pivot_table = grouped[score_col].unstack()
                 
                 im = ax.imshow(pivot_table, cmap='YlOrRd')
                 plt.colorbar(im)
@@ -280,9 +554,11 @@ class StrategyOptimizer:
         
     def _evaluate_parameters_multi_metric(self, params: Dict, 
                                         metrics: List[str] = None,
-                                        config: Dict = None) -> Tuple[Dict, Dict]:
+                                        config: Dict = None,
+                                        prune: bool = False) -> Tuple[Dict, Dict]:
         """
         评估单个参数组合的多个指标
+        :param prune: 是否允许回测中途因阶段回撤过差被终止，终止时所有指标记为-inf
         """
         try:
             if config is None:
@@ -290,38 +566,36 @@ class StrategyOptimizer:
             if metrics is None:
                 metrics = ['profit_factor']
             
-            test_config = config.copy()
+            # 深拷贝配置，浅拷贝会共享嵌套字典，写入参数时会改动基础配置
+            test_config = copy.deepcopy(config)
             
             # 更新配置中的参数
             for key, value in params.items():
-                if '.' in key:
-                    parts = key.split('.')
-                    current_dict = test_config
-                    for part in parts[:-1]:
-                        if part not in current_dict:
-                            current_dict[part] = {}
-                        current_dict = current_dict[part]
-                    current_dict[parts[-1]] = value
-                else:
-                    test_config[key] = value
+                parts = self._key_paths.get(key) or tuple(key.split('.'))
+                current_dict = test_config
+                for part in parts[:-1]:
+                    if part not in current_dict:
+                        current_dict[part] = {}
+                    current_dict = current_dict[part]
+                current_dict[parts[-1]] = value
             
             # 初始化策略并生成信号
             strategy = TradingStrategy(test_config)
-            data = self.data_fetcher.get_historical_data(test_config)
+            data = _worker_data if _worker_data is not None else self._get_cached_data(test_config)
             
             if data is None:
-                return params, {metric: float('-inf') for metric in metrics}
+                return params, {f'{metric}_score': float('-inf') for metric in metrics}
             
-            strategy.data = data
-            strategy.indicators = Indicators(data)
-            strategy.indicators.calculate_all_indicators()
-            strategy.signals = SignalGenerator(data)
-            strategy.signals.generate_all_signals()
+            # 指标和信号只取决于数据，同一份数据直接复用已计算的结果
+            strategy.data = _prepare_signals(data)
             
             # 执行回测
             backtester = Backtester(test_config, self.initial_capital)
-            backtester.run_backtest(strategy.data)
-            results = backtester.generate_report()
+            progress_callback = partial(_prune_callback, n_bars=len(strategy.data)) if prune else None
+            backtester.run_backtest(strategy.data, progress_callback=progress_callback)
+            if backtester.pruned:
+                return params, {f'{metric}_score': float('-inf') for metric in metrics}
+            results = backtester.summarize(metrics)
             
             # 计算所有指标的分数
             scores = {}
@@ -2,6 +2,10 @@
 风险管理模块，负责仓位计算和风险控制
 """
 
+# 市场波动性对应的止损倍数，未列出的情况使用默认值
+_VOLATILITY_SL_MULTIPLIERS = {'high': 2.0, 'low': 1.0}
+_DEFAULT_SL_MULTIPLIER = 1.5
+
 class RiskManager:
     """风险管理器，负责计算仓位大小和控制风险暴露"""
     
@@ -36,15 +40,9 @@ class RiskManager:
         :param market_volatility: 市场波动性，'high'、'low'或None
         :return: 调整后的仓位大小
         """
-        if market_volatility == 'high':
-            # 高波动性时使用更大的止损倍数
-            return self.calculate_position_size(atr, stop_loss_multiplier=2.0)
-        elif market_volatility == 'low':
-            # 低波动性时使用更小的止损倍数
-            return self.calculate_position_size(atr, stop_loss_multiplier=1.0)
-        else:
-            # 默认情况
-            return self.calculate_position_size(atr)
+        # 高波动性时使用更大的止损倍数，低波动性时使用更小的止损倍数
+        stop_loss_multiplier = _VOLATILITY_SL_MULTIPLIERS.get(market_volatility, _DEFAULT_SL_MULTIPLIER)
+        return self.calculate_position_size(atr, stop_loss_multiplier=stop_loss_multiplier)
 
     def can_open_trade(self, current_open_trades):
         """
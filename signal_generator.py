@@ -2,6 +2,10 @@
 交易信号生成模块，负责根据技术指标生成买卖信号
 """
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from kernels import rolling_mean_kernel, NUMBA_AVAILABLE
+
 class SignalGenerator:
     """交易信号生成器，根据多种技术指标生成交易信号"""
     
@@ -11,6 +15,7 @@ class SignalGenerator:
         :param data: 包含技术指标数据的DataFrame
         """
         self.data = data
+        self._cached_diffs = {}  # 各列一阶差分缓存，多空条件共用
 
     def generate_long_signals(self):
         """
@@ -22,14 +27,24 @@ class SignalGenerator:
         5. 乔金波动率上升
         6. RVI > 60且上穿信号线
         """
-        self.data['short_signal'] = (
+        self.data['short_signal'] = self._long_mask()
+
+    def _long_mask(self):
+        """
+        计算多头条件掩码（写入short_signal列）
+        :return: 布尔数组
+        """
+        # 在numpy数组上计算掩码，不生成中间Series
+        rvi = self.data['RVI'].to_numpy()
+        rvi_signal = self.data['RVI_signal'].to_numpy()
+        return (
             # (self.data['close'] > self.data['DC_upper']) &
             # (self.data['close'] > self.data['BB_upper']) &
-            # (self.data['KC_middle'].diff() > 0) &
-            # (self.data['ATR'].diff() > 0) &
-            # (self.data['Volatility_Chaikin'].diff() > 0) &
-            (self.data['RVI'] > 60) &
-            (self.data['RVI'] > self.data['RVI_signal'])
+            # (self._diff('KC_middle') > 0) &
+            # (self._diff('ATR') > 0) &
+            # (self._diff('Volatility_Chaikin') > 0) &
+            (rvi > 60) &
+            (rvi > rvi_signal)
         )
 
     # def generate_long_signals(self):
@@ -61,14 +76,24 @@ class SignalGenerator:
         5. 乔金波动率上升
         6. RVI < 40且下穿信号线
         """
-        self.data['long_signal'] = (
+        self.data['long_signal'] = self._short_mask()
+
+    def _short_mask(self):
+        """
+        计算空头条件掩码（写入long_signal列）
+        :return: 布尔数组
+        """
+        # 在numpy数组上计算掩码，不生成中间Series
+        rvi = self.data['RVI'].to_numpy()
+        rvi_signal = self.data['RVI_signal'].to_numpy()
+        return (
             # (self.data['close'] < self.data['DC_lower']) &
             # (self.data['close'] < self.data['BB_lower']) &
-            # (self.data['KC_middle'].diff() < 0) &
-            # (self.data['ATR'].diff() > 0) &
-            # (self.data['Volatility_Chaikin'].diff() > 0) &
-            (self.data['RVI'] < 40) &
-            (self.data['RVI'] < self.data['RVI_signal'])
+            # (self._diff('KC_middle') < 0) &
+            # (self._diff('ATR') > 0) &
+            # (self._diff('Volatility_Chaikin') > 0) &
+            (rvi < 40) &
+            (rvi < rvi_signal)
         )
 
     # def generate_short_signals(self):
@@ -90,24 +115,63 @@ class SignalGenerator:
     #         # (self.data['RVI'] < self.data['RVI_signal'])
     #     )
 
+    def _diff(self, column):
+        """
+        获取列的一阶差分数组（首元素为NaN，与Series.diff()一致），每列只计算一次
+        :param column: 列名
+        :return: 差分数组
+        """
+        diff = self._cached_diffs.get(column)
+        if diff is None:
+            values = self.data[column].to_numpy(dtype=np.float64)
+            diff = np.empty_like(values)
+            diff[:1] = np.nan
+            np.subtract(values[1:], values[:-1], out=diff[1:])
+            self._cached_diffs[column] = diff
+        return diff
+
     def filter_signals(self):
         """
         过滤交易信号，添加额外条件：
         1. 成交量需高于20周期平均成交量
         """
+        # 多空信号共用同一个放量掩码，一次写入两列
+        high_volume = self._volume_mask()
+        self.data[['long_signal', 'short_signal']] = np.column_stack([
+            self.data['long_signal'].to_numpy() & high_volume,
+            self.data['short_signal'].to_numpy() & high_volume
+        ])
+
+    def _volume_mask(self):
+        """
+        计算放量掩码：成交量高于20周期平均成交量
+        :return: 布尔数组
+        """
         # 使用tick_volume作为交易量指标
-        self.data['long_signal'] = self.data['long_signal'] & (
-            self.data['tick_volume'] > self.data['tick_volume'].rolling(20).mean()
-        )
-        self.data['short_signal'] = self.data['short_signal'] & (
-            self.data['tick_volume'] > self.data['tick_volume'].rolling(20).mean()
-        )
+        window = 20
+        volume = self.data['tick_volume'].to_numpy(dtype=np.float64)
+        if NUMBA_AVAILABLE:
+            return volume > rolling_mean_kernel(volume, window)
+
+        # 未安装numba时内核退化为逐元素Python循环，改用滑动窗口视图整体求均值；
+        # 前window-1根K线没有完整窗口，视为不满足条件
+        high_volume = np.zeros(volume.shape[0], dtype=np.bool_)
+        if volume.shape[0] >= window:
+            volume_ma = sliding_window_view(volume, window).mean(axis=1)
+            high_volume[window - 1:] = volume[window - 1:] > volume_ma
+        return high_volume
 
     def generate_all_signals(self):
         """生成所有交易信号，包括多头、空头信号和过滤"""
-        self.generate_long_signals()
-        self.generate_short_signals()
-        # self.filter_signals()
+        # 指标列可能已重新计算，差分缓存按本次生成重新建立
+        self._cached_diffs = {}
+        # 先计算全部掩码，再一次性写入两列，减少DataFrame的列块重组
+        long_mask = self._long_mask()
+        short_mask = self._short_mask()
+        # high_volume = self._volume_mask()
+        # long_mask &= high_volume
+        # short_mask &= high_volume
+        self.data[['short_signal', 'long_signal']] = np.column_stack([long_mask, short_mask])
         
         # 打印信号统计信息
         long_count = self.data['long_signal'].sum()
@@ -1,22 +1,10 @@
-from indicators import Indicators
-from signal_generator import SignalGenerator
-from trade_executor import TradeExecutor
-from risk_manager import RiskManager
-from logger import TradeLogger
-from backtester import Backtester
-from datetime import datetime
-
-
 """
 策略模式实现模块，包含交易策略、实时执行器和回测执行器
 """
 
-from datetime import datetime
+import numpy as np
 from indicators import Indicators
 from signal_generator import SignalGenerator
-from trade_executor import TradeExecutor
-from risk_manager import RiskManager
-from logger import TradeLogger
 from backtester import Backtester
 
 class TradingStrategy:
@@ -31,6 +19,8 @@ class TradingStrategy:
         self.data = None  # 存储市场数据
         self.indicators = None  # 存储技术指标
         self.signals = None  # 存储交易信号
+        self._arrays = None  # 执行阶段使用的列数组（按列存储）
+        self._arrays_source = None  # 列数组对应的DataFrame
 
     def prepare_data(self, data_fetcher):
         """
@@ -51,15 +41,39 @@ class TradingStrategy:
         self.signals = SignalGenerator(self.data)
         self.signals.generate_all_signals()
 
+        # 提取执行阶段用到的列为连续数组
+        self.get_arrays()
+
+    def get_arrays(self):
+        """
+        获取执行阶段用到的列数组，同一份数据只提取一次
+        :return: 以列名为键的字典，包含close、ATR、long_signal、short_signal的连续numpy数组
+        """
+        if self._arrays is None or self._arrays_source is not self.data:
+            self._arrays = {
+                'close': np.ascontiguousarray(self.data['close'].to_numpy(dtype=np.float64)),
+                'ATR': np.ascontiguousarray(self.data['ATR'].to_numpy(dtype=np.float64)),
+                'long_signal': np.ascontiguousarray(self.data['long_signal'].to_numpy(dtype=np.bool_)),
+                'short_signal': np.ascontiguousarray(self.data['short_signal'].to_numpy(dtype=np.bool_))
+            }
+            self._arrays_source = self.data
+        return self._arrays
+
     def execute(self, executor):
         """
         执行交易策略
         :param executor: 执行器实例（LiveExecutor或BacktestExecutor）
         """
-        # 遍历数据，根据信号执行交易
-        for index, row in self.data.iterrows():
-            if row['long_signal'] or row['short_signal']:
-                executor.execute_trade(row)
+        # 支持整段数据批量处理的执行器（如回测）一次性处理全部数据，避免逐K线分发
+        if hasattr(executor, 'execute_batch'):
+            executor.execute_batch(self.data)
+            return
+
+        # 先用列数组选出有信号的K线，只对这些行逐行执行交易，避免iterrows()为每行构造Series
+        arrays = self.get_arrays()
+        signal_idx = np.flatnonzero(arrays['long_signal'] | arrays['short_signal'])
+        for row in self.data.iloc[signal_idx].to_dict('records'):
+            executor.execute_trade(row)
 
 class LiveExecutor:
     """实时交易执行器，负责执行实时交易操作"""
@@ -69,6 +83,11 @@ class LiveExecutor:
         初始化实时交易执行器
         :param config: 配置字典，包含交易参数
         """
+        # 延迟导入实盘相关模块，只做回测时无需加载MT5
+        from trade_executor import TradeExecutor
+        from risk_manager import RiskManager
+        from logger import TradeLogger
+
         # 初始化交易执行模块
         self.trade_executor = TradeExecutor(
             symbol=config['symbol'],
@@ -123,6 +142,14 @@ class BacktestExecutor:
         # 回测已在初始化时运行，这里不需要执行任何操作
         pass
 
+    def execute_batch(self, data):
+        """
+        批量执行回测交易
+        :param data: 包含交易信号和指标数据的DataFrame
+        """
+        # 回测已在初始化时由向量化内核一次性完成，无需逐K线处理
+        pass
+
     def get_report(self):
         """
         获取回测报告
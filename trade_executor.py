@@ -2,9 +2,14 @@
 交易执行模块，负责通过MT5 API执行交易订单
 """
 
-import MetaTrader5 as mt5
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from kernels import LONG, SHORT, FLAT
+
+# 实盘下单使用的止损止盈ATR倍数
+SL_ATR_MULTIPLIER = 1.5
+TP_ATR_MULTIPLIER = 2.0
 
 class TradeExecutor:
     """交易执行器，封装MT5交易执行功能"""
@@ -15,10 +20,26 @@ class TradeExecutor:
         :param symbol: 交易品种，默认为EURUSD
         :param magic_number: 订单标识符，用于区分不同策略的订单
         """
+        # 延迟导入MT5，仅在创建实盘执行器时加载，回测流程无需安装MT5
+        import MetaTrader5 as mt5
+
+        self._mt5 = mt5
         self.symbol = symbol
         self.magic_number = magic_number
         mt5.initialize()  # 初始化MT5连接
 
+        # 预先构建开仓和平仓请求中固定不变的字段，下单时只填入随订单变化的字段
+        self._order_template = {
+            "action": mt5.TRADE_ACTION_DEAL,  # 立即执行订单
+            "symbol": self.symbol,
+            "deviation": 20,  # 允许的最大价格偏差
+            "magic": self.magic_number,  # 订单标识符
+            "comment": "Python script open",  # 订单注释
+            "type_time": mt5.ORDER_TIME_GTC,  # 订单有效期直到取消
+            "type_filling": mt5.ORDER_FILLING_IOC,  # 立即成交否则取消
+        }
+        self._close_template = dict(self._order_template, comment="Python script close")
+
     def place_order(self, order_type, price, volume, sl, tp):
         """
         下单操作
@@ -30,24 +51,18 @@ class TradeExecutor:
         :return: 订单执行结果
         """
         # 转换订单类型
-        order_type = mt5.ORDER_TYPE_BUY if order_type == 'buy' else mt5.ORDER_TYPE_SELL
-        # 构建订单请求
-        request = {
-            "action": mt5.TRADE_ACTION_DEAL,  # 立即执行订单
-            "symbol": self.symbol,
-            "volume": volume,
-            "type": order_type,
-            "price": price,
-            "sl": sl,  # 止损
-            "tp": tp,  # 止盈
-            "deviation": 20,  # 允许的最大价格偏差
-            "magic": self.magic_number,  # 订单标识符
-            "comment": "Python script open",  # 订单注释
-            "type_time": mt5.ORDER_TIME_GTC,  # 订单有效期直到取消
-            "type_filling": mt5.ORDER_FILLING_IOC,  # 立即成交否则取消
-        }
+        order_type = self._mt5.ORDER_TYPE_BUY if order_type == 'buy' else self._mt5.ORDER_TYPE_SELL
+        # 基于模板构建订单请求
+        request = self._order_template.copy()
+        request.update(
+            volume=volume,
+            type=order_type,
+            price=price,
+            sl=sl,  # 止损
+            tp=tp  # 止盈
+        )
         # 发送订单请求
-        result = mt5.order_send(request)
+        result = self._mt5.order_send(request)
         return result
 
     def close_order(self, position, price):
@@ -58,46 +73,65 @@ class TradeExecutor:
         :return: 平仓执行结果
         """
         # 确定平仓订单类型
-        order_type = mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
-        # 构建平仓请求
-        request = {
-            "action": mt5.TRADE_ACTION_DEAL,
-            "symbol": self.symbol,
-            "volume": position.volume,
-            "type": order_type,
-            "position": position.ticket,  # 要平仓的持仓ID
-            "price": price,
-            "deviation": 20,
-            "magic": self.magic_number,
-            "comment": "Python script close",
-            "type_time": mt5.ORDER_TIME_GTC,
-            "type_filling": mt5.ORDER_FILLING_IOC,
-        }
+        order_type = self._mt5.ORDER_TYPE_SELL if position.type == self._mt5.ORDER_TYPE_BUY else self._mt5.ORDER_TYPE_BUY
+        # 基于模板构建平仓请求
+        request = self._close_template.copy()
+        request.update(
+            volume=position.volume,
+            type=order_type,
+            position=position.ticket,  # 要平仓的持仓ID
+            price=price
+        )
         # 发送平仓请求
-        result = mt5.order_send(request)
+        result = self._mt5.order_send(request)
         return result
 
     def get_open_positions(self):
         """
         获取当前持仓
-        :return: 包含当前持仓的DataFrame
+        :return: MT5返回的持仓命名元组序列，获取失败时为空元组
         """
-        positions = mt5.positions_get(symbol=self.symbol)
-        return pd.DataFrame(positions)
+        positions = self._mt5.positions_get(symbol=self.symbol)
+        return positions if positions is not None else ()
+
+    def get_open_positions_df(self):
+        """
+        获取当前持仓表
+        :return: 每行一个持仓的DataFrame
+        """
+        positions = self.get_open_positions()
+        if len(positions) == 0:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records(positions, columns=positions[0]._fields)
+
+    def precompute_levels(self, data):
+        """
+        一次性计算整段数据每根K线的交易方向和止损止盈价格，多空共用同一组带符号的公式，不逐行分支
+        :param data: 包含收盘价、ATR和多空信号的DataFrame，或以列名为键的数组字典
+        :return: 包含direction（1多头、-1空头、0无信号，多空同时出现时以多头为准）、sl、tp数组的字典
+        """
+        close = np.asarray(data['close'], dtype=np.float64)
+        atr = np.asarray(data['ATR'], dtype=np.float64)
+        long_signal = np.asarray(data['long_signal'], dtype=np.bool_)
+        short_signal = np.asarray(data['short_signal'], dtype=np.bool_)
+        direction = np.where(long_signal, LONG, np.where(short_signal, SHORT, FLAT)).astype(np.int8)
+        return {
+            'direction': direction,
+            'sl': close - direction * SL_ATR_MULTIPLIER * atr,
+            'tp': close + direction * TP_ATR_MULTIPLIER * atr
+        }
 
     def manage_trades(self, data):
         """
         管理交易，根据信号执行买卖操作
-        :param data: 包含交易信号和指标数据的DataFrame
+        :param data: 包含交易信号和指标数据的DataFrame，或以列名为键的数组字典（如TradingStrategy.get_arrays()）
         """
-        for index, row in data.iterrows():
-            if row['long_signal']:
-                # 计算多头止损和止盈
-                sl = row['close'] - 1.5 * row['ATR']
-                tp = row['close'] + 2 * row['ATR']
-                self.place_order('buy', row['close'], 0.1, sl, tp)
-            elif row['short_signal']:
-                # 计算空头止损和止盈
-                sl = row['close'] + 1.5 * row['ATR']
-                tp = row['close'] - 2 * row['ATR']
-                self.place_order('sell', row['close'], 0.1, sl, tp)
+        # 一次性生成全部信号K线的下单参数，Python层只负责逐笔发送订单
+        levels = self.precompute_levels(data)
+        idx = np.flatnonzero(levels['direction'])
+        sides = levels['direction'][idx]
+        prices = np.asarray(data['close'], dtype=np.float64)[idx]
+        sls = levels['sl'][idx]
+        tps = levels['tp'][idx]
+        for side, price, sl, tp in zip(sides, prices, sls, tps):
+            self.place_order('buy' if side == LONG else 'sell', price, 0.1, sl, tp)